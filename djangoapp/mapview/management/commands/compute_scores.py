@@ -0,0 +1,157 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from mapview.models import StationScore, StationScorePeriod
+from mapview.partitions import ensure_yearly_usage_index
+from mapview.precompute import (
+    SCORE_FIELDS,
+    chunk_day_flows,
+    init_worker,
+    month_chunks,
+    reduce_period_flows,
+    score_period,
+    standard_periods,
+)
+from mapview.utils import _stations_latlon_by_abbr
+
+
+class Command(BaseCommand):
+    help = 'Precompute station score components for every standard period (day, ISO week, month, year)'
+    BATCH_SIZE = 100_000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-s', '--start-date',
+            type=date.fromisoformat,
+            required=True,
+            help='First date of the span (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '-e', '--end-date',
+            type=date.fromisoformat,
+            required=True,
+            help='Last date of the span (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '-w', '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: CPU count)',
+        )
+        parser.add_argument(
+            '--parquet',
+            type=str,
+            required=False,
+            help='Also write the scores to this Parquet file',
+        )
+
+    def handle(self, *args, **options):
+        start_date = options['start_date']
+        end_date = options['end_date']
+        workers = max(1, options['workers'])
+        parquet_path = Path(options['parquet']) if options['parquet'] else None
+
+        if start_date > end_date:
+            raise CommandError('Start date must be before or equal to end date')
+
+        if parquet_path is not None:
+            try:
+                import pandas as pd
+            except ImportError:
+                raise CommandError('--parquet requires pandas and pyarrow')
+
+        periods = standard_periods(start_date, end_date)
+        days = [p[1] for p in periods if p[0] == 'day']
+        self.stdout.write(f'> {len(periods):,} periods over {len(days):,} days, {workers} workers')
+
+        timings = {}
+        stations_latlon_by_abbr = _stations_latlon_by_abbr()
+
+        # Keeps the per-month map queries off full scans of an unpartitioned YearlyUsage
+        ensure_yearly_usage_index()
+
+        # Workers open their own connections
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            t = time.perf_counter()
+            flows_by_day = {}
+            for chunk_flows in pool.map(chunk_day_flows, month_chunks(start_date, end_date)):
+                flows_by_day.update(chunk_flows)
+            timings['map (per-day flows)'] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            flows_by_period = reduce_period_flows(periods, flows_by_day)
+            timings['reduce (merge flows)'] = time.perf_counter() - t
+
+            t = time.perf_counter()
+            scores_by_period = dict(pool.map(
+                score_period,
+                ((period, flows, stations_latlon_by_abbr) for period, flows in flows_by_period.items()),
+            ))
+            timings['score'] = time.perf_counter() - t
+
+        rows = [
+            StationScore(
+                period_type=period_type,
+                period_start=period_start,
+                period_end=period_end,
+                abbreviation=abbr,
+                **vals,
+            )
+            for (period_type, period_start, period_end), scores in scores_by_period.items()
+            for abbr, vals in scores.items()
+        ]
+
+        t = time.perf_counter()
+        with transaction.atomic():
+            StationScore.objects.filter(
+                period_start__gte=start_date,
+                period_end__lte=end_date,
+            ).delete()
+            StationScorePeriod.objects.filter(
+                period_start__gte=start_date,
+                period_end__lte=end_date,
+            ).delete()
+            StationScore.objects.bulk_create(rows, batch_size=self.BATCH_SIZE)
+            # Marks every period, including those without trips and thus without rows
+            StationScorePeriod.objects.bulk_create(
+                [
+                    StationScorePeriod(period_type=period_type, period_start=period_start, period_end=period_end)
+                    for period_type, period_start, period_end in scores_by_period
+                ],
+                batch_size=self.BATCH_SIZE,
+            )
+        timings['write StationScore'] = time.perf_counter() - t
+
+        if parquet_path is not None:
+            t = time.perf_counter()
+            df = pd.DataFrame(
+                [
+                    {
+                        'period_type': r.period_type,
+                        'period_start': r.period_start,
+                        'period_end': r.period_end,
+                        'abbreviation': r.abbreviation,
+                        **{k: getattr(r, k) for k in SCORE_FIELDS},
+                    }
+                    for r in rows
+                ],
+            )
+            df.to_parquet(
+                parquet_path,
+                engine='pyarrow',
+                compression='snappy',
+                index=False
+            )
+            timings['write Parquet'] = time.perf_counter() - t
+
+        for stage, seconds in timings.items():
+            self.stdout.write(f'>> {stage}: {seconds:.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'> Stored {len(rows):,} station scores for {len(periods):,} periods'))
@@ -1,9 +1,15 @@
 import csv
+from collections import defaultdict
+from datetime import date
 from pathlib import Path
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.apps import apps
 from django.db import models, transaction
 
+from mapview.models import Stations, UsagePartition, YearlyUsage
+from mapview.partitions import create_partition_table, partition_model, register_partition
+from mapview.precompute import invalidate_station_scores
+
 
 class Command(BaseCommand):
     help = 'Load station data from CSV into a specified model'
@@ -28,6 +34,11 @@ class Command(BaseCommand):
             required=False,
             help='Header line for the CSV data',
         )
+        parser.add_argument(
+            '-p', '--partitioned',
+            action='store_true',
+            help='Route OD rows into per-year partitions instead of the target model table',
+        )
 
     def handle(self, *args, **options):
         csv_path = Path(options['file'])
@@ -45,8 +56,18 @@ class Command(BaseCommand):
             return
         self.stdout.write(f'> Target Model: {Model}')
 
+        if options['partitioned']:
+            if Model is not YearlyUsage:
+                raise CommandError('--partitioned is only supported for the YearlyUsage model')
+            self.load_partitioned(csv_path, options.get('header', None))
+            return
+
+        # Rows of partitioned years would never be read back from YearlyUsage
+        partitioned_years = set(UsagePartition.objects.values_list('year', flat=True)) if Model is YearlyUsage else set()
+
         objs = []
         total = 0
+        first_date = last_date = None
 
         with open(csv_path, newline='', encoding='utf-8') as f:
             headers = options.get('header', None)
@@ -57,6 +78,12 @@ class Command(BaseCommand):
 
             with transaction.atomic():
                 for row in reader:
+                    if Model is YearlyUsage:
+                        d = date.fromisoformat(row['date'])
+                        if d.year in partitioned_years:
+                            raise CommandError(f'{d.year} is partitioned, load it with --partitioned instead')
+                        first_date = d if first_date is None else min(first_date, d)
+                        last_date = d if last_date is None else max(last_date, d)
                     objs.append(Model(**row))
 
                     if len(objs) >= self.BATCH_SIZE:
@@ -69,4 +96,81 @@ class Command(BaseCommand):
                     Model.objects.bulk_create(objs, batch_size=self.BATCH_SIZE)
                     total += len(objs)
 
+                # Precomputed scores of the loaded dates are now stale
+                if first_date is not None:
+                    invalidate_station_scores(first_date, last_date)
+                # Access scores depend on station coordinates, so every precomputed period is stale
+                if Model is Stations:
+                    invalidate_station_scores()
+
         self.stdout.write(self.style.SUCCESS(f'> Inserted {total:,} rows into {model_name}'))
+
+    def load_partitioned(self, csv_path: Path, headers: str | None):
+        def open_reader(f):
+            if headers is not None:
+                return csv.DictReader(f, fieldnames=headers.split(','))
+            return csv.DictReader(f)
+
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            dates = {date.fromisoformat(row['date']) for row in open_reader(f)}
+        if not dates:
+            self.stdout.write(self.style.SUCCESS('> Inserted 0 rows'))
+            return
+        years = sorted({d.year for d in dates})
+
+        partitions = {p.year: p for p in UsagePartition.objects.filter(year__in=years)}
+        read_only = [year for year, p in partitions.items() if p.read_only]
+        if read_only:
+            raise CommandError(f'Partitions are read-only: {", ".join(map(str, read_only))}')
+
+        # Registering a year hides its YearlyUsage rows, so those must be moved first
+        unmigrated = [
+            year for year in years
+            if year not in partitions
+            and YearlyUsage.objects.filter(date__gte=date(year, 1, 1), date__lte=date(year, 12, 31)).exists()
+        ]
+        if unmigrated:
+            raise CommandError(
+                f'YearlyUsage still holds rows of {", ".join(map(str, unmigrated))}: '
+                f'run `partition_usage --migrate` first'
+            )
+
+        # Partition tables must exist before the atomic load (the SQLite schema
+        # editor cannot run inside a transaction)
+        for year in years:
+            create_partition_table(year)
+
+        objs_by_year = defaultdict(list)
+        total_by_year = defaultdict(int)
+
+        def flush(year):
+            objs = objs_by_year[year]
+            partition_model(year).objects.bulk_create(objs, batch_size=self.BATCH_SIZE)
+            total_by_year[year] += len(objs)
+            objs.clear()
+
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            with transaction.atomic():
+                for row in open_reader(f):
+                    year = date.fromisoformat(row['date']).year
+                    objs_by_year[year].append(partition_model(year)(**row))
+
+                    if len(objs_by_year[year]) >= self.BATCH_SIZE:
+                        flush(year)
+                        self.stdout.write(f'>> {year}: inserted {total_by_year[year]:,} rows')
+
+                for year in objs_by_year:
+                    if objs_by_year[year]:
+                        flush(year)
+
+                # Registered only once the rows are in place
+                for year in years:
+                    partition = register_partition(year)
+                    partition.row_count += total_by_year[year]
+                    partition.save(update_fields=['row_count'])
+
+                # Precomputed scores of the loaded dates are now stale
+                invalidate_station_scores(min(dates), max(dates))
+
+        for year in sorted(total_by_year):
+            self.stdout.write(self.style.SUCCESS(f'> Inserted {total_by_year[year]:,} rows into partition {year}'))
@@ -0,0 +1,159 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.functions import ExtractYear
+
+from mapview.models import UsagePartition, YearlyUsage
+from mapview.partitions import create_partition_table, ensure_yearly_usage_index, register_partition
+from mapview.precompute import invalidate_station_scores
+
+
+class Command(BaseCommand):
+    help = 'Manage per-year partitions of the OD usage data'
+    BATCH_SIZE = 100_000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='List registered partitions',
+        )
+        parser.add_argument(
+            '--migrate',
+            action='store_true',
+            help='Copy YearlyUsage rows into their per-year partitions',
+        )
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            help='With --migrate, overwrite partitions that already hold rows',
+        )
+        parser.add_argument(
+            '--delete-source',
+            action='store_true',
+            help='With --migrate, delete the copied rows from YearlyUsage',
+        )
+        parser.add_argument(
+            '--read-only',
+            type=int,
+            metavar='YEAR',
+            help='Mark the partition of YEAR as read-only',
+        )
+        parser.add_argument(
+            '--writable',
+            type=int,
+            metavar='YEAR',
+            help='Mark the partition of YEAR as writable again',
+        )
+        parser.add_argument(
+            '--compact',
+            type=int,
+            metavar='YEAR',
+            help='Rebuild the indexes and statistics of the partition of YEAR',
+        )
+        parser.add_argument(
+            '--vacuum',
+            action='store_true',
+            help='Reclaim free pages in the database file (SQLite only)',
+        )
+
+    def handle(self, *args, **options):
+        # Indexes declared after the YearlyUsage table was created are never added by syncdb
+        ensure_yearly_usage_index()
+
+        if options['migrate']:
+            self.migrate_yearly_usage(options['replace'], options['delete_source'])
+
+        if options['read_only'] is not None:
+            self.set_read_only(options['read_only'], True)
+        if options['writable'] is not None:
+            self.set_read_only(options['writable'], False)
+
+        if options['compact'] is not None:
+            partition = self.get_partition(options['compact'])
+            with connection.cursor() as cursor:
+                cursor.execute(f'REINDEX {connection.ops.quote_name(partition.db_table)}')
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(partition.db_table)}')
+            self.stdout.write(self.style.SUCCESS(f'> Compacted partition {partition.year}'))
+
+        if options['vacuum']:
+            if connection.vendor != 'sqlite':
+                raise CommandError('--vacuum is only supported on SQLite')
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+            self.stdout.write(self.style.SUCCESS('> Vacuumed database'))
+
+        if options['list']:
+            for partition in UsagePartition.objects.all():
+                self.stdout.write(f'> {partition} [{partition.db_table}, {partition.row_count:,} rows]')
+
+    def get_partition(self, year: int) -> UsagePartition:
+        try:
+            return UsagePartition.objects.get(year=year)
+        except UsagePartition.DoesNotExist:
+            raise CommandError(f'No partition registered for {year}')
+
+    def set_read_only(self, year: int, read_only: bool):
+        partition = self.get_partition(year)
+        partition.read_only = read_only
+        partition.save(update_fields=['read_only'])
+        self.stdout.write(self.style.SUCCESS(f'> {partition}'))
+
+    def migrate_yearly_usage(self, replace: bool, delete_source: bool):
+        years = list(
+            YearlyUsage.objects
+            .annotate(year=ExtractYear('date'))
+            .values_list('year', flat=True)
+            .distinct()
+            .order_by('year')
+        )
+
+        for year in years:
+            partition = UsagePartition.objects.filter(year=year).first()
+            if partition is not None and partition.read_only:
+                self.stderr.write(f'> Skipping read-only partition {year}')
+                continue
+
+            Model = create_partition_table(year)
+            if Model.objects.exists() and not replace:
+                self.stderr.write(f'> Skipping partition {year}: it already holds rows (use --replace to overwrite)')
+                continue
+
+            start_date, end_date = date(year, 1, 1), date(year, 12, 31)
+            source = YearlyUsage.objects.filter(date__gte=start_date, date__lte=end_date)
+            rows = (
+                source
+                .values('date', 'hour', 'source', 'destination', 'passengers')
+                .order_by('date', 'hour')
+            )
+
+            objs = []
+            total = 0
+            with transaction.atomic():
+                Model.objects.all().delete()
+                for row in rows.iterator(chunk_size=self.BATCH_SIZE):
+                    objs.append(Model(**row))
+
+                    if len(objs) >= self.BATCH_SIZE:
+                        Model.objects.bulk_create(objs, batch_size=self.BATCH_SIZE)
+                        total += len(objs)
+                        objs.clear()
+                        self.stdout.write(f'>> {year}: copied {total:,} rows')
+
+                if objs:
+                    Model.objects.bulk_create(objs, batch_size=self.BATCH_SIZE)
+                    total += len(objs)
+
+                # Registered only once the rows are in place: from here on the year is read from the partition
+                partition = register_partition(year)
+                partition.row_count = total
+                partition.save(update_fields=['row_count'])
+
+                if delete_source:
+                    source.delete()
+
+                # Precomputed scores of the year may be stale
+                invalidate_station_scores(start_date, end_date)
+
+            self.stdout.write(self.style.SUCCESS(f'> Partition {year}: {total:,} rows'))
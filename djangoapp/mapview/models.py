@@ -12,12 +12,117 @@ class Stations(models.Model):
         return f'{self.code} - {self.name}'
 
 
-class YearlyUsage(models.Model):
+class UsageRecord(models.Model):
+    """
+    Shared OD schema for YearlyUsage and the per-year partition tables
+    (see partitions.py).
+    """
     date = models.DateField()
     hour = models.PositiveBigIntegerField()
     source = models.CharField(max_length=4)
     destination = models.CharField(max_length=4)
     passengers = models.IntegerField()
 
+    class Meta:
+        abstract = True
+
     def __str__(self):
         return f'{self.date}:{self.hour}|{self.source}->{self.destination}'
+
+
+class YearlyUsage(UsageRecord):
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'hour']),
+        ]
+
+
+class UsagePartition(models.Model):
+    """
+    Registry row for one date partition of the OD data.
+
+    Each partition owns its own table (`db_table`) holding the rows whose date
+    falls in [start_date, end_date]. Read-only partitions are never written to
+    by load_csv / partition_usage.
+    """
+    year = models.PositiveIntegerField(unique=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    db_table = models.CharField(max_length=64, unique=True)
+    read_only = models.BooleanField(default=False)
+    row_count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['start_date']
+        indexes = [
+            models.Index(fields=['start_date', 'end_date']),
+        ]
+
+    def __str__(self):
+        ro = ' (read-only)' if self.read_only else ''
+        return f'{self.year}: {self.start_date} -> {self.end_date}{ro}'
+
+
+PERIOD_TYPES = [
+    ('day', 'Day'),
+    ('week', 'ISO week'),
+    ('month', 'Month'),
+    ('year', 'Year'),
+]
+
+
+class StationScorePeriod(models.Model):
+    """
+    Marks a standard period as precomputed by the compute_scores command, so
+    that a period without any trips (and thus without StationScore rows) is
+    still served from the precomputed results.
+    """
+    period_type = models.CharField(max_length=5, choices=PERIOD_TYPES)
+    period_start = models.DateField()
+    period_end = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period_type', 'period_start'],
+                name='unique_station_score_period',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['period_start', 'period_end']),
+        ]
+
+    def __str__(self):
+        return f'{self.period_type}:{self.period_start}->{self.period_end}'
+
+
+class StationScore(models.Model):
+    """
+    Precomputed score components of one station over a standard period
+    (see the compute_scores command and StationScorePeriod). "as" is not stored: it is the
+    weighted sum of board / eff_dst / access and is built at request time.
+    """
+    period_type = models.CharField(max_length=5, choices=PERIOD_TYPES)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    abbreviation = models.CharField(max_length=4)
+    board = models.FloatField()
+    eff_dst = models.FloatField()
+    access = models.FloatField()
+    raw_boardings = models.FloatField()
+    raw_eff_dst = models.FloatField()
+    raw_access = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period_type', 'period_start', 'abbreviation'],
+                name='unique_station_score_per_period',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['period_start', 'period_end']),
+        ]
+
+    def __str__(self):
+        return f'{self.period_type}:{self.period_start}->{self.period_end}|{self.abbreviation}'
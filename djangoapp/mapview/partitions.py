@@ -0,0 +1,121 @@
+from datetime import date
+
+from django.apps import apps
+from django.db import connection, models
+
+from .models import UsageRecord, UsagePartition, YearlyUsage
+
+
+def _partition_table(year: int) -> str:
+    return f'mapview_usage_{year}'
+
+
+def partition_model(year: int) -> type[models.Model]:
+    """
+    Returns the (unmanaged) model class backed by the partition table of `year`.
+
+    Classes are built once and then served from the app registry, so repeated
+    calls return the same class.
+    """
+    name = f'Usage{year}'
+    try:
+        return apps.get_model('mapview', name)
+    except LookupError:
+        pass
+
+    meta = type('Meta', (), {
+        'db_table': _partition_table(year),
+        'managed': False,
+        'indexes': [models.Index(fields=['date', 'hour'], name=f'usage_{year}_date_hour')],
+    })
+    return type(name, (UsageRecord,), {
+        '__module__': 'mapview.models',
+        'Meta': meta,
+    })
+
+
+def create_partition_table(year: int) -> type[models.Model]:
+    """
+    Creates the partition table of `year` (with its (date, hour) index) if it
+    does not exist yet, and returns its model. The table is not read until the
+    year is registered with register_partition().
+
+    Must not be called inside an atomic block: the SQLite schema editor
+    refuses to run in one.
+    """
+    Model = partition_model(year)
+
+    if _partition_table(year) not in connection.introspection.table_names():
+        with connection.schema_editor() as editor:
+            editor.create_model(Model)
+    return Model
+
+
+def register_partition(year: int) -> UsagePartition:
+    """
+    Returns the registry entry for `year`, creating it if needed. From then on
+    usage_querysets() reads that year from the partition only, so call this in
+    the same transaction that fills the partition, after its rows are in place.
+    """
+    partition, _ = UsagePartition.objects.get_or_create(
+        year=year,
+        defaults={
+            'start_date': date(year, 1, 1),
+            'end_date': date(year, 12, 31),
+            'db_table': _partition_table(year),
+        },
+    )
+    return partition
+
+
+def ensure_yearly_usage_index():
+    """
+    Creates YearlyUsage's (date, hour) index on databases whose table predates it:
+    the app has no migrations, so `migrate --run-syncdb` never adds it.
+    """
+    index = YearlyUsage._meta.indexes[0]
+    columns = ', '.join(
+        connection.ops.quote_name(YearlyUsage._meta.get_field(f).column) for f in index.fields
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {connection.ops.quote_name(index.name)} '
+            f'ON {connection.ops.quote_name(YearlyUsage._meta.db_table)} ({columns})'
+        )
+
+
+def partitions_for_range(start_date: date, end_date: date) -> list[UsagePartition]:
+    """
+    Registry entries overlapping [start_date, end_date], oldest first.
+    """
+    return list(UsagePartition.objects.filter(
+        start_date__lte=end_date,
+        end_date__gte=start_date,
+    ))
+
+
+def usage_querysets(start_date: date, end_date: date) -> list[models.QuerySet]:
+    """
+    Query router for OD records in [start_date, end_date], oldest slice first.
+
+    Each year of the range is read from its partition when one is registered,
+    and from the monolithic YearlyUsage table otherwise; consecutive unpartitioned
+    years are read with a single YearlyUsage query.
+    """
+    partitioned_years = {p.year for p in partitions_for_range(start_date, end_date)}
+
+    slices: list[list] = []  # [Model, slice_start, slice_end]
+    for year in range(start_date.year, end_date.year + 1):
+        Model = partition_model(year) if year in partitioned_years else YearlyUsage
+        slice_start = max(start_date, date(year, 1, 1))
+        slice_end = min(end_date, date(year, 12, 31))
+
+        if slices and slices[-1][0] is YearlyUsage and Model is YearlyUsage:
+            slices[-1][2] = slice_end
+        else:
+            slices.append([Model, slice_start, slice_end])
+
+    return [
+        Model.objects.filter(date__gte=slice_start, date__lte=slice_end)
+        for Model, slice_start, slice_end in slices
+    ]
@@ -0,0 +1,197 @@
+from datetime import date, timedelta
+from typing import Mapping
+
+from .utils import merge_od_flows, station_attractiveness_scores_from_flows
+
+# Model imports stay local below: this module is imported by process-pool
+# workers before Django's app registry is ready.
+
+Period = tuple[str, date, date]  # (period_type, period_start, period_end)
+Flows = dict[str, dict[str, float]]
+
+SCORE_FIELDS = ('board', 'eff_dst', 'access', 'raw_boardings', 'raw_eff_dst', 'raw_access')
+
+
+def _add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def standard_periods(start_date: date, end_date: date) -> list[Period]:
+    """
+    Every day, ISO week (Monday to Sunday), calendar month and calendar year
+    lying entirely within [start_date, end_date].
+    """
+    periods: list[Period] = []
+
+    d = start_date
+    while d <= end_date:
+        periods.append(('day', d, d))
+        d += timedelta(days=1)
+
+    d = start_date + timedelta(days=(7 - start_date.weekday()) % 7)
+    while d + timedelta(days=6) <= end_date:
+        periods.append(('week', d, d + timedelta(days=6)))
+        d += timedelta(days=7)
+
+    d = start_date if start_date.day == 1 else _add_months(start_date, 1)
+    while _add_months(d, 1) - timedelta(days=1) <= end_date:
+        periods.append(('month', d, _add_months(d, 1) - timedelta(days=1)))
+        d = _add_months(d, 1)
+
+    d = start_date if (start_date.month, start_date.day) == (1, 1) else date(start_date.year + 1, 1, 1)
+    while date(d.year, 12, 31) <= end_date:
+        periods.append(('year', d, date(d.year, 12, 31)))
+        d = date(d.year + 1, 1, 1)
+
+    return periods
+
+
+def init_worker():
+    """
+    Process-pool initializer: sets Django up under the "spawn" start method
+    and drops any database connection inherited under "fork".
+    """
+    import django
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def month_chunks(start_date: date, end_date: date) -> list[tuple[date, date]]:
+    """
+    Splits [start_date, end_date] into calendar-month slices: the map tasks.
+    """
+    chunks = []
+    d = start_date
+    while d <= end_date:
+        chunk_end = min(end_date, _add_months(d.replace(day=1), 1) - timedelta(days=1))
+        chunks.append((d, chunk_end))
+        d = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def chunk_day_flows(chunk: tuple[date, date]) -> dict[date, Flows]:
+    """
+    Map step: per-day OD flows F_ij of every day in the chunk, aggregated
+    DB-side with one grouped query per partition. B_i and A_j are sums of F_ij,
+    so this is the only partial aggregate needed. Days without trips map to
+    empty flows.
+    """
+    from django.db.models import F, Sum
+    from .partitions import usage_querysets
+
+    start_date, end_date = chunk
+    flows_by_day: dict[date, Flows] = {
+        start_date + timedelta(days=i): {}
+        for i in range((end_date - start_date).days + 1)
+    }
+    for qs in usage_querysets(start_date, end_date):
+        rows = (
+            qs.filter(passengers__gt=0)
+            .exclude(source=F('destination'))
+            .values('date', 'source', 'destination')
+            .annotate(passengers=Sum('passengers'))
+        )
+        for r in rows:
+            if not r['source'] or not r['destination']:
+                continue
+            dsts = flows_by_day[r['date']].setdefault(r['source'], {})
+            dsts[r['destination']] = dsts.get(r['destination'], 0.0) + float(r['passengers'])
+    return flows_by_day
+
+
+def reduce_period_flows(periods: list[Period], flows_by_day: Mapping[date, Flows]) -> dict[Period, Flows]:
+    """
+    Reduce step: merges per-day flows into every period. Years are merged
+    from their months when those are available, instead of from 365 days.
+    """
+    flows_by_period: dict[Period, Flows] = {}
+    flows_by_month: dict[date, Flows] = {}
+
+    for period in sorted(periods, key=lambda p: ('day', 'week', 'month', 'year').index(p[0])):
+        period_type, start, end = period
+
+        if period_type == 'day':
+            flows = flows_by_day[start]
+        elif period_type == 'year' and all(date(start.year, m, 1) in flows_by_month for m in range(1, 13)):
+            flows = merge_od_flows(*(flows_by_month[date(start.year, m, 1)] for m in range(1, 13)))
+        else:
+            days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+            flows = merge_od_flows(*(flows_by_day[d] for d in days))
+
+        if period_type == 'month':
+            flows_by_month[start] = flows
+        flows_by_period[period] = flows
+
+    return flows_by_period
+
+
+def score_period(
+        args: tuple[Period, Flows, Mapping[str, tuple[float, float]]],
+) -> tuple[Period, dict[str, dict[str, float]]]:
+    """
+    Scores one period from its merged flows; "as" is dropped since it depends on the weights.
+    """
+    period, flows, stations_latlon_by_abbr = args
+    scores = station_attractiveness_scores_from_flows(
+        flows=flows,
+        stations_latlon_by_abbr=stations_latlon_by_abbr,
+    )
+    return period, {
+        abbr: {k: vals[k] for k in SCORE_FIELDS}
+        for abbr, vals in scores.items()
+    }
+
+
+def precomputed_station_scores(
+        *,
+        start_date: date,
+        end_date: date,
+        weights: tuple[float, float, float],
+) -> dict[str, dict[str, float]] | None:
+    """
+    Returns scores shaped like station_attractiveness_scores_from_filtered_records()
+    when [start_date, end_date] is a precomputed standard period (empty when that
+    period had no trips), else None.
+    """
+    from .models import StationScore, StationScorePeriod
+
+    if not StationScorePeriod.objects.filter(period_start=start_date, period_end=end_date).exists():
+        return None
+
+    w1, w2, w3 = weights
+    rows = StationScore.objects.filter(
+        period_start=start_date,
+        period_end=end_date,
+    ).values('abbreviation', *SCORE_FIELDS)
+
+    out: dict[str, dict[str, float]] = {}
+    for r in rows:
+        vals = {k: r[k] for k in SCORE_FIELDS}
+        vals['as'] = (w1 * vals['board']) + (w2 * vals['eff_dst']) + (w3 * vals['access'])
+        out[r['abbreviation']] = vals
+    return out
+
+
+def invalidate_station_scores(start_date: date | None = None, end_date: date | None = None) -> int:
+    """
+    Deletes precomputed scores of every period overlapping [start_date, end_date],
+    or of every period when no dates are given (e.g. after station coordinates change).
+    Must be called whenever OD rows of those dates are added, replaced or moved.
+    Returns the number of deleted StationScore rows.
+    """
+    from .models import StationScore, StationScorePeriod
+
+    scores = StationScore.objects.all()
+    periods = StationScorePeriod.objects.all()
+    if start_date is not None and end_date is not None:
+        scores = scores.filter(period_start__lte=end_date, period_end__gte=start_date)
+        periods = periods.filter(period_start__lte=end_date, period_end__gte=start_date)
+
+    periods.delete()
+    deleted, _ = scores.delete()
+    return deleted
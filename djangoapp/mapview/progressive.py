@@ -0,0 +1,197 @@
+import math
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Iterator, Mapping
+
+from django.db.models import F, Q, Sum
+
+from .partitions import usage_querysets
+from .utils import (
+    _stations_latlon_by_abbr,
+    merge_od_flows,
+    station_attractiveness_scores_from_flows,
+)
+
+# Fractions of the rounds (one date per hour stratum) aggregated before each refinement is emitted
+STAGE_FRACTIONS = (1 / 16, 1 / 8, 1 / 4, 1 / 2, 1.0)
+
+# Random groups used for the variance estimate, and the matching two-sided 95% t quantile (GROUPS - 1 dof)
+GROUPS = 4
+T_QUANTILE = 3.182
+
+# Bounds the number of query parameters per _fetch_unit_flows() query
+MAX_UNITS_PER_QUERY = 480
+
+HOURS = range(24)
+
+Unit = tuple[date, int]
+Flows = dict[str, dict[str, float]]
+
+
+def _stratified_units(start_date: date, end_date: date) -> list[Unit]:
+    """
+    Orders every (date, hour) unit in [start_date, end_date] in rounds of
+    len(HOURS) units: strata are the hours of the day, and each round draws one
+    not-yet-used date from every stratum. Prefixes made of whole rounds are
+    therefore stratified samples with the same number of units per stratum;
+    other prefixes are not.
+
+    The order is seeded by the date range, so repeated requests refine identically.
+    """
+    rng = random.Random(f'{start_date}:{end_date}')
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+    dates_by_hour = {}
+    for h in HOURS:
+        shuffled = days[:]
+        rng.shuffle(shuffled)
+        dates_by_hour[h] = shuffled
+
+    units: list[Unit] = []
+    for r in range(len(days)):
+        strata = list(HOURS)
+        rng.shuffle(strata)
+        units.extend((dates_by_hour[h][r], h) for h in strata)
+    return units
+
+
+def _fetch_unit_flows(units: list[Unit]) -> dict[Unit, Flows]:
+    """
+    Aggregates OD flows per (date, hour) unit, DB-side, for the given units only.
+    Units without any trips map to empty flows.
+
+    Units are queried in date order, MAX_UNITS_PER_QUERY at a time: each query
+    is bounded by the batch's date range (so partitions are pruned) and holds
+    one `hour = h AND date IN (...)` term per hour, however long the range.
+    """
+    flows_by_unit: dict[Unit, Flows] = {unit: {} for unit in units}
+    ordered = sorted(units)
+
+    for i in range(0, len(ordered), MAX_UNITS_PER_QUERY):
+        batch = ordered[i:i + MAX_UNITS_PER_QUERY]
+
+        dates_by_hour = defaultdict(list)
+        for d, h in batch:
+            dates_by_hour[h].append(d)
+
+        q = Q()
+        for h, dates in dates_by_hour.items():
+            q |= Q(hour=h, date__in=dates)
+
+        for qs in usage_querysets(batch[0][0], batch[-1][0]):
+            rows = (
+                qs.filter(q, passengers__gt=0)
+                .exclude(source=F('destination'))
+                .values('date', 'hour', 'source', 'destination')
+                .annotate(passengers=Sum('passengers'))
+            )
+            for r in rows:
+                if not r['source'] or not r['destination']:
+                    continue
+                dsts = flows_by_unit[(r['date'], r['hour'])].setdefault(r['source'], {})
+                dsts[r['destination']] = dsts.get(r['destination'], 0.0) + float(r['passengers'])
+
+    return flows_by_unit
+
+
+def _scores(
+        unit_flows: list[Flows],
+        total_units: int,
+        stations_latlon_by_abbr: Mapping[str, tuple[float, float]],
+        weights: tuple[float, float, float],
+) -> dict[str, dict[str, float]]:
+    # unit_flows are whole rounds, so every stratum has n_h = len(unit_flows) / len(HOURS) units and
+    # the stratified expansion N_h / n_h is the same for all strata. Raw values are expanded to the
+    # full range; normalised scores are scale-invariant.
+    return station_attractiveness_scores_from_flows(
+        flows=merge_od_flows(*unit_flows, scale=total_units / len(unit_flows)),
+        stations_latlon_by_abbr=stations_latlon_by_abbr,
+        weights=weights,
+    )
+
+
+def progressive_station_scores(
+        *,
+        start_date: date,
+        end_date: date,
+        weights: tuple[float, float, float],
+) -> Iterator[dict[str, Any]]:
+    """
+    Yields successively refined station scores for [start_date, end_date].
+
+    Each refinement aggregates a larger stratified sample of whole rounds of
+    (date, hour) units (see _stratified_units() and STAGE_FRACTIONS) and estimates scores from it, with
+    raw values scaled up to the full range.
+
+    Per-station 95% bounds on "as" come from the spread of the scores of GROUPS
+    sub-samples, each made of whole rounds (random-group variance estimation),
+    with a finite-population correction; every estimated stage, the first one
+    included, holds at least GROUPS rounds. A sub-sample in which a station has
+    no trips counts as an "as" of 0 for that station, which widens the bounds of
+    sparse stations rather than hiding their variance. Bounds are clipped to
+    [0, sum(weights)], the range "as" can take. The last refinement covers every
+    unit, is flagged "exact" and matches
+    station_attractiveness_scores_from_filtered_records().
+
+    Each yielded dict contains:
+        {
+          "sampled_units": int,
+          "total_units": int,
+          "progress": float in (0,1],
+          "exact": bool,
+          "scores": {abbr: {<station score fields>, "as_low": float, "as_high": float}},
+        }
+    """
+    units = _stratified_units(start_date, end_date)
+    total = len(units)
+    round_size = len(HOURS)
+    total_rounds = total // round_size
+    as_max = sum(weights)
+    stations_latlon_by_abbr = _stations_latlon_by_abbr()
+
+    stages = sorted({
+        min(total_rounds, max(GROUPS, math.ceil(total_rounds * f)))
+        for f in STAGE_FRACTIONS
+    })
+
+    flows_by_unit: dict[Unit, Flows] = {}
+    for rounds in stages:
+        n = rounds * round_size
+        flows_by_unit.update(_fetch_unit_flows(units[len(flows_by_unit):n]))
+        sampled = [flows_by_unit[u] for u in units[:n]]
+
+        scores = _scores(sampled, total, stations_latlon_by_abbr, weights)
+        exact = n == total
+
+        if exact:
+            for vals in scores.values():
+                vals['as_low'] = vals['as_high'] = vals['as']
+        else:
+            # Group k holds rounds k, k + GROUPS, k + 2 * GROUPS, ...
+            groups = [
+                _scores(
+                    [
+                        f for r in range(k, rounds, GROUPS)
+                        for f in sampled[r * round_size:(r + 1) * round_size]
+                    ],
+                    total, stations_latlon_by_abbr, weights,
+                )
+                for k in range(GROUPS)
+            ]
+            fpc = 1.0 - n / total
+            for abbr, vals in scores.items():
+                xs = [grp.get(abbr, {}).get('as', 0.0) for grp in groups]
+                mean = sum(xs) / GROUPS
+                var = sum((x - mean) ** 2 for x in xs) / (GROUPS * (GROUPS - 1))
+                half = T_QUANTILE * math.sqrt(fpc * var)
+                vals['as_low'] = max(0.0, vals['as'] - half)
+                vals['as_high'] = min(as_max, vals['as'] + half)
+
+        yield {
+            'sampled_units': n,
+            'total_units': total,
+            'progress': n / total,
+            'exact': exact,
+            'scores': scores,
+        }
@@ -124,6 +124,7 @@ class AttractivenessScorerUI {
         this.w1Input = document.getElementById('w1-input');
         this.w2Input = document.getElementById('w2-input');
         this.w3Input = document.getElementById('w3-input');
+        this.progressiveInput = document.getElementById('progressive-input');
 
         this.splitter = new WeightSplitterBar();
 
@@ -142,7 +143,7 @@ class AttractivenessScorerUI {
         const rows = results.slice(0, 20).map(r => `
             <tr>
                 <td>${r.abbr}</td>
-                <td>${Number(r.as).toFixed(3)}</td>
+                <td>${Number(r.as).toFixed(3)}${this.formatBounds(r)}</td>
                 <td>${Number(r.board).toFixed(3)}</td>
                 <td>${Number(r.eff_dst).toFixed(3)}</td>
                 <td>${Number(r.access).toFixed(3)}</td>
@@ -168,6 +169,48 @@ class AttractivenessScorerUI {
         `;
     }
 
+    formatBounds(r) {
+        if (r.as_low === undefined || r.as_high === undefined || r.as_low === r.as_high) return '';
+        return ` <span style="opacity:0.7;">[${Number(r.as_low).toFixed(3)}, ${Number(r.as_high).toFixed(3)}]</span>`;
+    }
+
+    publish(data) {
+        this.renderTable(data.results || []);
+
+        window.lastStationScores = data;
+        window.dispatchEvent(new CustomEvent('station-scores-updated', { detail: data }));
+    }
+
+    async readProgressive(res) {
+        // NDJSON: one refinement per line, the last one is exact
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let data = null;
+
+        while (true) {
+            const {value, done} = await reader.read();
+            buffer += decoder.decode(value || new Uint8Array(), {stream: !done});
+
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                data = JSON.parse(line);
+
+                if (!data.exact) {
+                    this.setStatus(
+                        `Estimated ${data.count} stations from ${(data.progress * 100).toFixed(0)}% of hours, refining...`
+                    );
+                }
+                this.publish(data);
+            }
+            if (done) break;
+        }
+        return data;
+    }
+
     async compute() {
         const start = this.startDateInput?.value;
         const end = this.endDateInput?.value;
@@ -191,12 +234,19 @@ class AttractivenessScorerUI {
                 + `&w1=${encodeURIComponent(w1)}`
                 + `&w2=${encodeURIComponent(w2)}`
                 + `&w3=${encodeURIComponent(w3)}`;
+            const progressive = Boolean(this.progressiveInput?.checked);
 
-            const res = await fetch(url);
-            const data = await res.json();
+            const res = await fetch(progressive ? `${url}&progressive=1` : url);
 
             if (!res.ok) {
-                this.setStatus(data?.error || `HTTP error ${res.status}`);
+                const err = await res.json();
+                this.setStatus(err?.error || `HTTP error ${res.status}`);
+                return;
+            }
+
+            const data = progressive ? await this.readProgressive(res) : await res.json();
+            if (!data) {
+                this.setStatus('No scores returned.');
                 return;
             }
 
@@ -204,10 +254,7 @@ class AttractivenessScorerUI {
                 `Computed ${data.count} stations for ${data.start_date} → ${data.end_date} `
                 + `(w1=${data.weights.w1.toFixed(2)}, w2=${data.weights.w2.toFixed(2)}, w3=${data.weights.w3.toFixed(2)}).`
             );
-            this.renderTable(data.results || []);
-
-            window.lastStationScores = data;
-            window.dispatchEvent(new CustomEvent('station-scores-updated', { detail: data }));
+            if (!progressive) this.publish(data);
         } catch (e) {
             console.error(e);
             this.setStatus('Failed to compute scores. See console for details.');
@@ -1 +1,466 @@
-from django.test import TestCase
+import csv
+import json
+import shutil
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from .models import StationScore, StationScorePeriod, Stations, UsagePartition, YearlyUsage
+from .partitions import (
+    create_partition_table,
+    ensure_yearly_usage_index,
+    partition_model,
+    register_partition,
+    usage_querysets,
+)
+from .precompute import (
+    chunk_day_flows,
+    invalidate_station_scores,
+    month_chunks,
+    reduce_period_flows,
+    standard_periods,
+)
+from .progressive import GROUPS, HOURS, MAX_UNITS_PER_QUERY, _stratified_units, progressive_station_scores
+from .utils import (
+    aggregate_od_flows,
+    station_attractiveness_scores_from_filtered_records,
+    station_attractiveness_scores_from_flows,
+)
+
+STATIONS = {'AAA': (37.80, -122.27), 'BBB': (37.76, -122.42), 'CCC': (37.85, -122.25)}
+
+RECORDS = [
+    {'source': 'AAA', 'destination': 'BBB', 'passengers': 10},
+    {'source': 'AAA', 'destination': 'CCC', 'passengers': 5},
+    {'source': 'AAA', 'destination': 'AAA', 'passengers': 7},
+    {'source': 'BBB', 'destination': 'AAA', 'passengers': 3},
+    {'source': 'BBB', 'destination': 'CCC', 'passengers': 0},
+    {'source': 'CCC', 'destination': 'AAA', 'passengers': 8},
+    {'source': 'CCC', 'destination': 'BBB', 'passengers': 2},
+    {'source': 'CCC', 'destination': 'ZZZ', 'passengers': 4},
+]
+
+
+def _od(model, d, source, destination, passengers, hour=8):
+    return model.objects.create(date=d, hour=hour, source=source, destination=destination, passengers=passengers)
+
+
+class PartitionRouterTests(TransactionTestCase):
+    # create_partition_table() runs DDL, which SQLite refuses inside TestCase's transaction
+
+    def tearDown(self):
+        tables = connection.introspection.table_names()
+        with connection.schema_editor() as editor:
+            for year in (2019, 2020):
+                if f'mapview_usage_{year}' in tables:
+                    editor.delete_model(partition_model(year))
+
+    def rows(self, start_date, end_date):
+        return [
+            (r['date'], r['source'])
+            for qs in usage_querysets(start_date, end_date)
+            for r in qs.values('date', 'source').order_by('date')
+        ]
+
+    def test_falls_back_to_yearly_usage_without_partitions(self):
+        _od(YearlyUsage, date(2019, 12, 31), 'A', 'B', 1)
+        _od(YearlyUsage, date(2020, 1, 1), 'B', 'A', 1)
+
+        querysets = usage_querysets(date(2019, 12, 30), date(2020, 1, 2))
+
+        self.assertEqual([qs.model for qs in querysets], [YearlyUsage])
+        self.assertEqual(self.rows(date(2019, 12, 30), date(2020, 1, 2)), [
+            (date(2019, 12, 31), 'A'),
+            (date(2020, 1, 1), 'B'),
+        ])
+
+    def test_routes_each_year_to_its_partition_or_yearly_usage(self):
+        Usage2020 = create_partition_table(2020)
+        register_partition(2020)
+        _od(YearlyUsage, date(2019, 12, 31), 'A', 'B', 1)
+        _od(YearlyUsage, date(2020, 1, 1), 'X', 'Y', 1)  # shadowed by the 2020 partition
+        _od(Usage2020, date(2020, 1, 1), 'B', 'A', 1)
+
+        querysets = usage_querysets(date(2019, 12, 30), date(2020, 1, 2))
+
+        self.assertEqual([qs.model for qs in querysets], [YearlyUsage, Usage2020])
+        self.assertEqual(self.rows(date(2019, 12, 30), date(2020, 1, 2)), [
+            (date(2019, 12, 31), 'A'),
+            (date(2020, 1, 1), 'B'),
+        ])
+
+    def test_prunes_partitions_outside_range(self):
+        for year in (2019, 2020):
+            create_partition_table(year)
+            register_partition(year)
+
+        querysets = usage_querysets(date(2020, 3, 1), date(2020, 3, 7))
+
+        self.assertEqual([qs.model for qs in querysets], [partition_model(2020)])
+
+    def test_yearly_usage_index_is_recreated(self):
+        index = YearlyUsage._meta.indexes[0].name
+        table = YearlyUsage._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(index)}')
+
+        ensure_yearly_usage_index()
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        self.assertEqual(constraints[index]['columns'], ['date', 'hour'])
+
+    def write_csv(self, rows):
+        path = Path(tempfile.mkdtemp()) / 'usage.csv'
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['date', 'hour', 'source', 'destination', 'passengers'])
+            writer.writeheader()
+            writer.writerows(rows)
+        self.addCleanup(shutil.rmtree, path.parent)
+        return str(path)
+
+    def test_load_partitioned_refuses_years_still_in_yearly_usage(self):
+        for day in (1, 1, 2):
+            _od(YearlyUsage, date(2019, 3, day), 'A', 'B', 1)
+        path = self.write_csv([
+            {'date': '2019-12-31', 'hour': 8, 'source': 'A', 'destination': 'B', 'passengers': 1},
+        ])
+
+        with self.assertRaisesMessage(CommandError, 'partition_usage --migrate'):
+            call_command('load_csv', file=path, model='YearlyUsage', partitioned=True, stdout=StringIO())
+
+        self.assertFalse(UsagePartition.objects.exists())
+        self.assertEqual(len(self.rows(date(2019, 3, 1), date(2019, 3, 2))), 3)
+
+    def test_load_partitioned_after_migrate_keeps_every_row(self):
+        for day in (1, 1, 2):
+            _od(YearlyUsage, date(2019, 3, day), 'A', 'B', 1)
+        path = self.write_csv([
+            {'date': '2019-12-31', 'hour': 8, 'source': 'A', 'destination': 'B', 'passengers': 1},
+        ])
+
+        call_command('partition_usage', migrate=True, delete_source=True, stdout=StringIO(), stderr=StringIO())
+        call_command('load_csv', file=path, model='YearlyUsage', partitioned=True, stdout=StringIO())
+
+        self.assertEqual(list(UsagePartition.objects.values_list('year', 'row_count')), [(2019, 4)])
+        self.assertFalse(YearlyUsage.objects.exists())
+        self.assertEqual(len(self.rows(date(2019, 3, 1), date(2019, 12, 31))), 4)
+
+
+class StationScoresTests(SimpleTestCase):
+    # Expected values were produced by the scorer before it was split into flows + scoring
+    EXPECTED = {
+        'AAA': {'board': 1.0, 'eff_dst': 0.5560057054, 'access': 0.4313669654, 'as': 0.7530751047,
+                'raw_boardings': 15.0, 'raw_eff_dst': 1.8898815748, 'raw_access': 1.5366668229},
+        'BBB': {'board': 0.0, 'eff_dst': 0.0, 'access': 0.0, 'as': 0.0,
+                'raw_boardings': 3.0, 'raw_eff_dst': 1.0, 'raw_access': 1.0010766323},
+        'CCC': {'board': 0.9166666667, 'eff_dst': 1.0, 'access': 1.0, 'as': 0.9583333333,
+                'raw_boardings': 14.0, 'raw_eff_dst': 2.600490006, 'raw_access': 2.2426881453},
+    }
+
+    def assertScoresEqual(self, scores, expected):
+        self.assertEqual(scores.keys(), expected.keys())
+        for abbr, vals in expected.items():
+            for k, v in vals.items():
+                self.assertAlmostEqual(scores[abbr][k], v, places=8, msg=f'{abbr}.{k}')
+
+    def test_aggregate_od_flows_drops_self_loops_and_empty_rows(self):
+        self.assertEqual(aggregate_od_flows(RECORDS), {
+            'AAA': {'BBB': 10.0, 'CCC': 5.0},
+            'BBB': {'AAA': 3.0},
+            'CCC': {'AAA': 8.0, 'BBB': 2.0, 'ZZZ': 4.0},
+        })
+
+    def test_scores_from_records_match_reference(self):
+        scores = station_attractiveness_scores_from_filtered_records(
+            records=RECORDS,
+            stations_latlon_by_abbr=STATIONS,
+            weights=(0.5, 0.3, 0.2),
+        )
+        self.assertScoresEqual(scores, self.EXPECTED)
+
+    def test_scores_from_flows_match_reference(self):
+        scores = station_attractiveness_scores_from_flows(
+            flows=aggregate_od_flows(RECORDS),
+            stations_latlon_by_abbr=STATIONS,
+            weights=(0.5, 0.3, 0.2),
+        )
+        self.assertScoresEqual(scores, self.EXPECTED)
+
+
+class StratifiedUnitsTests(SimpleTestCase):
+    def test_every_round_covers_each_hour_once(self):
+        start_date, end_date = date(2019, 1, 1), date(2019, 1, 8)
+        units = _stratified_units(start_date, end_date)
+        n = len(HOURS)
+
+        self.assertEqual(len(units), 8 * n)
+        self.assertEqual(len(set(units)), len(units))
+        for r in range(8):
+            self.assertEqual(sorted(h for _, h in units[r * n:(r + 1) * n]), list(HOURS))
+
+    def test_order_is_deterministic(self):
+        self.assertEqual(
+            _stratified_units(date(2019, 1, 1), date(2019, 1, 7)),
+            _stratified_units(date(2019, 1, 1), date(2019, 1, 7)),
+        )
+
+
+class ProgressiveStationScoresTests(TestCase):
+    start_date = date(2019, 1, 1)
+    end_date = date(2019, 1, 8)
+    weights = (0.5, 0.3, 0.2)
+
+    @classmethod
+    def setUpTestData(cls):
+        for i, (abbr, (lat, lon)) in enumerate(STATIONS.items()):
+            Stations.objects.create(code=str(i), name=abbr, abbreviation=abbr, latitude=lat, longitude=lon)
+
+        d = cls.start_date
+        i = 0
+        while d <= cls.end_date:
+            for hour in (6, 8, 12, 17, 22):
+                for r in RECORDS:
+                    i += 1
+                    _od(YearlyUsage, d, r['source'], r['destination'], r['passengers'] + i % 5, hour=hour)
+            d += timedelta(days=1)
+
+    def stages(self):
+        return list(progressive_station_scores(
+            start_date=self.start_date,
+            end_date=self.end_date,
+            weights=self.weights,
+        ))
+
+    def test_stages_are_whole_rounds(self):
+        stages = self.stages()
+
+        self.assertGreaterEqual(stages[0]['sampled_units'], len(HOURS))
+        for stage in stages:
+            self.assertEqual(stage['sampled_units'] % len(HOURS), 0)
+        self.assertEqual([s['exact'] for s in stages], [False] * (len(stages) - 1) + [True])
+
+    def test_bounds_stay_within_score_range(self):
+        for stage in self.stages():
+            for vals in stage['scores'].values():
+                self.assertLessEqual(0.0, vals['as_low'])
+                self.assertLessEqual(vals['as_low'], vals['as'])
+                self.assertLessEqual(vals['as'], vals['as_high'])
+                self.assertLessEqual(vals['as_high'], sum(self.weights) + 1e-12)
+
+    def test_first_stage_has_enough_rounds_for_bounds(self):
+        first = self.stages()[0]
+        self.assertGreaterEqual(first['sampled_units'], GROUPS * len(HOURS))
+        self.assertTrue(any(
+            (vals['as_low'], vals['as_high']) != (0.0, sum(self.weights))
+            for vals in first['scores'].values()
+        ))
+
+    def test_last_stage_is_exact(self):
+        last = self.stages()[-1]
+        expected = station_attractiveness_scores_from_filtered_records(
+            records=YearlyUsage.objects.values('source', 'destination', 'passengers'),
+            weights=self.weights,
+        )
+
+        self.assertEqual(last['sampled_units'], last['total_units'])
+        self.assertEqual(last['scores'].keys(), expected.keys())
+        for abbr, vals in expected.items():
+            for k, v in vals.items():
+                self.assertAlmostEqual(last['scores'][abbr][k], v, places=9, msg=f'{abbr}.{k}')
+            self.assertEqual(last['scores'][abbr]['as_low'], vals['as'])
+            self.assertEqual(last['scores'][abbr]['as_high'], vals['as'])
+
+
+    def test_long_range_last_stage_is_exact(self):
+        # 30 days: more units than one query batch, data only on the first 8 days
+        end_date = self.start_date + timedelta(days=29)
+        self.assertGreater(30 * len(HOURS), MAX_UNITS_PER_QUERY)
+
+        stages = list(progressive_station_scores(
+            start_date=self.start_date,
+            end_date=end_date,
+            weights=self.weights,
+        ))
+        expected = station_attractiveness_scores_from_filtered_records(
+            records=YearlyUsage.objects.values('source', 'destination', 'passengers'),
+            weights=self.weights,
+        )
+
+        self.assertLess(stages[0]['sampled_units'], stages[0]['total_units'])
+        last = stages[-1]
+        self.assertTrue(last['exact'])
+        self.assertEqual(last['total_units'], 30 * len(HOURS))
+        for abbr, vals in expected.items():
+            self.assertAlmostEqual(last['scores'][abbr]['as'], vals['as'], places=9)
+
+    def test_view_streams_ranges_longer_than_eight_days(self):
+        params = {'start_date': '2019-01-01', 'end_date': '2019-01-20'}
+
+        self.assertEqual(self.client.get('/api/station-scores/', params).status_code, 400)
+
+        res = self.client.get('/api/station-scores/', {**params, 'progressive': '1'})
+        self.assertEqual(res.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(res.streaming_content).decode().splitlines()]
+        self.assertGreater(len(lines), 1)
+        self.assertTrue(lines[-1]['exact'])
+        self.assertEqual(lines[-1]['count'], len(STATIONS))
+
+
+class StandardPeriodsTests(SimpleTestCase):
+    def periods(self, start_date, end_date, period_type):
+        return [(s, e) for t, s, e in standard_periods(start_date, end_date) if t == period_type]
+
+    def test_days_cover_the_span(self):
+        days = self.periods(date(2019, 12, 30), date(2020, 1, 2), 'day')
+        self.assertEqual([s for s, _ in days], [date(2019, 12, 30) + timedelta(days=i) for i in range(4)])
+        self.assertTrue(all(s == e for s, e in days))
+
+    def test_iso_weeks_are_whole_monday_to_sunday(self):
+        # 2019-12-30 is the Monday of ISO week 2020-W01; the span ends on a Saturday
+        weeks = self.periods(date(2019, 12, 28), date(2020, 1, 18), 'week')
+        self.assertEqual(weeks, [
+            (date(2019, 12, 30), date(2020, 1, 5)),
+            (date(2020, 1, 6), date(2020, 1, 12)),
+        ])
+
+    def test_months_are_whole_calendar_months(self):
+        months = self.periods(date(2019, 11, 2), date(2020, 3, 31), 'month')
+        self.assertEqual(months, [
+            (date(2019, 12, 1), date(2019, 12, 31)),
+            (date(2020, 1, 1), date(2020, 1, 31)),
+            (date(2020, 2, 1), date(2020, 2, 29)),
+            (date(2020, 3, 1), date(2020, 3, 31)),
+        ])
+
+    def test_years_are_whole_calendar_years(self):
+        self.assertEqual(self.periods(date(2019, 1, 1), date(2020, 12, 30), 'year'), [
+            (date(2019, 1, 1), date(2019, 12, 31)),
+        ])
+        self.assertEqual(self.periods(date(2019, 1, 2), date(2020, 12, 31), 'year'), [
+            (date(2020, 1, 1), date(2020, 12, 31)),
+        ])
+
+    def test_month_chunks_split_on_month_edges(self):
+        self.assertEqual(month_chunks(date(2020, 1, 30), date(2020, 3, 2)), [
+            (date(2020, 1, 30), date(2020, 1, 31)),
+            (date(2020, 2, 1), date(2020, 2, 29)),
+            (date(2020, 3, 1), date(2020, 3, 2)),
+        ])
+
+
+class ReducePeriodFlowsTests(SimpleTestCase):
+    def test_matches_direct_aggregation(self):
+        start_date, end_date = date(2019, 1, 1), date(2020, 1, 31)
+        periods = standard_periods(start_date, end_date)
+
+        records_by_day = {}
+        d, i = start_date, 0
+        while d <= end_date:
+            records_by_day[d] = [
+                {**r, 'passengers': r['passengers'] + (i + j) % 7}
+                for j, r in enumerate(RECORDS)
+            ]
+            d += timedelta(days=1)
+            i += 1
+        flows_by_day = {d: aggregate_od_flows(records) for d, records in records_by_day.items()}
+
+        flows_by_period = reduce_period_flows(periods, flows_by_day)
+
+        self.assertEqual(flows_by_period.keys(), set(periods))
+        for period_type, s, e in periods:
+            direct = aggregate_od_flows(
+                r for d, records in records_by_day.items() if s <= d <= e for r in records
+            )
+            merged = flows_by_period[(period_type, s, e)]
+            self.assertEqual(merged.keys(), direct.keys(), msg=f'{period_type} {s}')
+            for src, dsts in direct.items():
+                for dst, p in dsts.items():
+                    self.assertAlmostEqual(merged[src][dst], p, msg=f'{period_type} {s} {src}->{dst}')
+
+
+class PrecomputedScoresTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i, (abbr, (lat, lon)) in enumerate(STATIONS.items()):
+            Stations.objects.create(code=str(i), name=abbr, abbreviation=abbr, latitude=lat, longitude=lon)
+        for r in RECORDS:
+            _od(YearlyUsage, date(2019, 1, 31), r['source'], r['destination'], r['passengers'])
+            _od(YearlyUsage, date(2019, 2, 1), r['source'], r['destination'], r['passengers'], hour=9)
+
+    def store(self, period_type, period_start, period_end, with_scores=True):
+        StationScorePeriod.objects.create(period_type=period_type, period_start=period_start, period_end=period_end)
+        if not with_scores:
+            return
+        StationScore.objects.create(
+            period_type=period_type, period_start=period_start, period_end=period_end, abbreviation='AAA',
+            board=1.0, eff_dst=0.5, access=0.25, raw_boardings=15.0, raw_eff_dst=1.9, raw_access=1.5,
+        )
+
+    def test_chunk_day_flows_groups_by_day(self):
+        flows = chunk_day_flows((date(2019, 1, 30), date(2019, 2, 1)))
+        self.assertEqual(flows[date(2019, 1, 30)], {})
+        self.assertEqual(flows[date(2019, 1, 31)], aggregate_od_flows(RECORDS))
+        self.assertEqual(flows[date(2019, 2, 1)], aggregate_od_flows(RECORDS))
+
+    def test_invalidate_deletes_overlapping_periods_only(self):
+        self.store('day', date(2019, 1, 31), date(2019, 1, 31))
+        self.store('month', date(2019, 1, 1), date(2019, 1, 31))
+        self.store('month', date(2019, 2, 1), date(2019, 2, 28))
+
+        invalidate_station_scores(date(2019, 1, 15), date(2019, 1, 31))
+
+        self.assertEqual(
+            list(StationScore.objects.values_list('period_start', flat=True)),
+            [date(2019, 2, 1)],
+        )
+        self.assertEqual(
+            list(StationScorePeriod.objects.values_list('period_start', flat=True)),
+            [date(2019, 2, 1)],
+        )
+
+    def test_precomputed_period_without_trips_is_served_empty(self):
+        self.store('month', date(2019, 3, 1), date(2019, 3, 31), with_scores=False)
+
+        res = self.client.get('/api/station-scores/', {'start_date': '2019-03-01', 'end_date': '2019-03-31'})
+
+        self.assertEqual(res.status_code, 200)
+        data = res.json()
+        self.assertTrue(data['precomputed'])
+        self.assertEqual(data['count'], 0)
+
+    def test_loading_stations_invalidates_every_period(self):
+        self.store('month', date(2019, 1, 1), date(2019, 1, 31))
+        self.store('year', date(2018, 1, 1), date(2018, 12, 31), with_scores=False)
+        path = Path(tempfile.mkdtemp()) / 'stations.csv'
+        self.addCleanup(shutil.rmtree, path.parent)
+        path.write_text('code,name,abbreviation,latitude,longitude\nDD,Fourth,DDD,37.7,-122.4\n', encoding='utf-8')
+
+        call_command('load_csv', file=str(path), model='Stations', stdout=StringIO())
+
+        self.assertFalse(StationScore.objects.exists())
+        self.assertFalse(StationScorePeriod.objects.exists())
+
+    def test_progressive_precomputed_stage_matches_stream_schema(self):
+        self.store('month', date(2019, 1, 1), date(2019, 1, 31))
+
+        res = self.client.get('/api/station-scores/', {
+            'start_date': '2019-01-01', 'end_date': '2019-01-31', 'progressive': '1',
+        })
+        lines = b''.join(res.streaming_content).decode().splitlines()
+
+        self.assertEqual(len(lines), 1)
+        stage = json.loads(lines[0])
+        self.assertTrue(stage['precomputed'])
+        self.assertTrue(stage['exact'])
+        self.assertEqual(stage['sampled_units'], 31 * len(HOURS))
+        self.assertEqual(stage['total_units'], 31 * len(HOURS))
+        [result] = stage['results']
+        self.assertEqual(result['as_low'], result['as'])
+        self.assertEqual(result['as_high'], result['as'])
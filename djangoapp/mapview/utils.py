@@ -37,6 +37,46 @@ def _stations_latlon_by_abbr() -> dict[str, tuple[float, float]]:
     }
 
 
+def aggregate_od_flows(records: Iterable[Mapping[str, Any]]) -> dict[str, dict[str, float]]:
+    """
+    Sums OD records into F_ij = {source: {destination: passengers}}.
+
+    Self-loops and rows with missing stations or non-positive passengers are
+    dropped. Flows are additive, so flows of disjoint record sets can be
+    combined with merge_od_flows().
+    """
+    flow_by_src_dst = defaultdict(lambda: defaultdict(float))  # F_ij
+
+    for r in records:
+        src = r.get("source")
+        dst = r.get("destination")
+        p = float(r.get("passengers") or 0)
+
+        if not src or not dst or p <= 0:
+            continue
+        if src == dst:
+            continue
+
+        flow_by_src_dst[src][dst] += p
+
+    return {src: dict(flows) for src, flows in flow_by_src_dst.items()}
+
+
+def merge_od_flows(
+        *flows: Mapping[str, Mapping[str, float]],
+        scale: float = 1.0,
+) -> dict[str, dict[str, float]]:
+    """
+    Adds several F_ij mappings together, multiplying the result by `scale`.
+    """
+    merged = defaultdict(lambda: defaultdict(float))
+    for f in flows:
+        for src, dsts in f.items():
+            for dst, p in dsts.items():
+                merged[src][dst] += p * scale
+    return {src: dict(dsts) for src, dsts in merged.items()}
+
+
 def station_attractiveness_scores_from_filtered_records(
         *,
         records: Iterable[Mapping[str, Any]],
@@ -54,6 +94,30 @@ def station_attractiveness_scores_from_filtered_records(
         If None, it will be loaded from Stations.abbreviation/latitude/longitude.
     - weights: (w1, w2, w3) for (Board, EffDst, Access)
 
+    Output
+    - see station_attractiveness_scores_from_flows()
+    """
+    return station_attractiveness_scores_from_flows(
+        flows=aggregate_od_flows(records),
+        stations_latlon_by_abbr=stations_latlon_by_abbr,
+        weights=weights,
+    )
+
+
+def station_attractiveness_scores_from_flows(
+        *,
+        flows: Mapping[str, Mapping[str, float]],
+        stations_latlon_by_abbr: Mapping[str, tuple[float, float]] | None = None,
+        weights: tuple[float, float, float] = (1.0, 1.0, 1.0),
+) -> dict[str, dict[str, float]]:
+    """
+    Computes station scores from aggregated OD flows (see aggregate_od_flows()).
+
+    Inputs
+    - flows: mapping "SRC" -> {"DST": passengers}
+    - stations_latlon_by_abbr, weights: as in
+      station_attractiveness_scores_from_filtered_records()
+
     Output
     - dict keyed by station abbreviation, with:
         {
@@ -71,24 +135,15 @@ def station_attractiveness_scores_from_filtered_records(
     if stations_latlon_by_abbr is None:
         stations_latlon_by_abbr = _stations_latlon_by_abbr()
 
-    # Aggregate from filtered records
+    # B_i and A_j follow from F_ij
     boardings_by_src = defaultdict(float)  # B_i
     inbound_by_dst = defaultdict(float)  # A_j
-    flow_by_src_dst = defaultdict(lambda: defaultdict(float))  # F_ij
-
-    for r in records:
-        src = r.get("source")
-        dst = r.get("destination")
-        p = float(r.get("passengers") or 0)
+    flow_by_src_dst = flows  # F_ij
 
-        if not src or not dst or p <= 0:
-            continue
-        if src == dst:
-            continue
-
-        boardings_by_src[src] += p
-        inbound_by_dst[dst] += p
-        flow_by_src_dst[src][dst] += p
+    for src, dsts in flow_by_src_dst.items():
+        for dst, p in dsts.items():
+            boardings_by_src[src] += p
+            inbound_by_dst[dst] += p
 
     # Data validation
     stations_in_scope = {
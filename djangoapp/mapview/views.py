@@ -1,8 +1,13 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from datetime import datetime
-from .models import Stations, YearlyUsage
+from itertools import chain
+import json
+from .models import Stations
+from .partitions import usage_querysets
+from .precompute import precomputed_station_scores
+from .progressive import HOURS, progressive_station_scores
 from .utils import station_attractiveness_scores_from_filtered_records
 
 
@@ -48,10 +53,11 @@ def fetch_data(request):
 
     try:
         if model == 'YearlyUsage':
-            records = YearlyUsage.objects.filter(
-                date__gte=start_date,
-                date__lte=end_date
-            ).values('date', 'hour', 'source', 'destination', 'passengers').order_by('date', 'hour')
+            # Partitions are returned oldest first, so per-partition ordering keeps the overall order
+            records = chain.from_iterable(
+                qs.values('date', 'hour', 'source', 'destination', 'passengers').order_by('date', 'hour')
+                for qs in usage_querysets(start_date, end_date)
+            )
 
             data = [
                 {
@@ -85,9 +91,6 @@ def station_scores(request):
     except ValueError:
         return JsonResponse({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
 
-    date_diff = (end_date - start_date).days
-    if date_diff > 7:
-        return JsonResponse({'error': 'Date range cannot exceed 7 days'}, status=400)
     if start_date > end_date:
         return JsonResponse({'error': 'Start date must be before or equal to end date'}, status=400)
 
@@ -117,32 +120,96 @@ def station_scores(request):
     # Normalize server-side to guarantee sum=1
     w1, w2, w3 = (w1 / s, w2 / s, w3 / s)
 
-    records = YearlyUsage.objects.filter(
-        date__gte=start_date,
-        date__lte=end_date,
-    ).values('source', 'destination', 'passengers')
+    weights = {'w1': w1, 'w2': w2, 'w3': w3}
+    progressive = request.GET.get('progressive') in ('1', 'true')
+
+    # Standard periods precomputed by compute_scores are a single indexed lookup, whatever their length
+    precomputed = precomputed_station_scores(
+        start_date=start_date,
+        end_date=end_date,
+        weights=(w1, w2, w3),
+    )
+    if precomputed is not None:
+        payload = _scores_payload(precomputed)
+        data = {
+            'start_date': str(start_date),
+            'end_date': str(end_date),
+            'weights': weights,
+            'precomputed': True,
+            'count': len(payload),
+            'results': payload,
+        }
+        if progressive:
+            # Already exact: a single refinement, shaped like progressive_station_scores() stages
+            total_units = ((end_date - start_date).days + 1) * len(HOURS)
+            for r in payload:
+                r['as_low'] = r['as_high'] = r['as']
+            return StreamingHttpResponse(
+                iter([json.dumps({
+                    **data,
+                    'sampled_units': total_units,
+                    'total_units': total_units,
+                    'progress': 1.0,
+                    'exact': True,
+                }) + '\n']),
+                content_type='application/x-ndjson',
+            )
+        return JsonResponse(data, safe=False)
+
+    # Progressive mode refines stratified samples over partition-pruned queries, so it is not capped
+    if progressive:
+        def _stream():
+            for stage in progressive_station_scores(
+                    start_date=start_date,
+                    end_date=end_date,
+                    weights=(w1, w2, w3),
+            ):
+                payload = _scores_payload(stage.pop('scores'))
+                yield json.dumps({
+                    'start_date': str(start_date),
+                    'end_date': str(end_date),
+                    'weights': weights,
+                    **stage,
+                    'count': len(payload),
+                    'results': payload,
+                }) + '\n'
+
+        return StreamingHttpResponse(_stream(), content_type='application/x-ndjson')
+
+    date_diff = (end_date - start_date).days
+    if date_diff > 7:
+        return JsonResponse({'error': 'Date range cannot exceed 7 days'}, status=400)
+
+    records = chain.from_iterable(
+        qs.values('source', 'destination', 'passengers')
+        for qs in usage_querysets(start_date, end_date)
+    )
 
     scores_by_abbr = station_attractiveness_scores_from_filtered_records(
         records=records,
         weights=(w1, w2, w3),
     )
-
-    payload = [
-        {
-            'abbr': abbr,
-            **vals,
-        }
-        for abbr, vals in scores_by_abbr.items()
-    ]
-    payload.sort(key=lambda x: x.get('as', 0.0), reverse=True)
+    payload = _scores_payload(scores_by_abbr)
 
     return JsonResponse(
         {
             'start_date': str(start_date),
             'end_date': str(end_date),
-            'weights': {'w1': w1, 'w2': w2, 'w3': w3},
+            'weights': weights,
             'count': len(payload),
             'results': payload,
         },
         safe=False
     )
+
+
+def _scores_payload(scores_by_abbr: dict[str, dict[str, float]]) -> list[dict]:
+    payload = [
+        {
+            'abbr': abbr,
+            **vals,
+        }
+        for abbr, vals in scores_by_abbr.items()
+    ]
+    payload.sort(key=lambda x: x.get('as', 0.0), reverse=True)
+    return payload